@@ -1,10 +1,55 @@
+import io
+import mmap
 import os
-import xml.etree.ElementTree as ET
 import struct
 import argparse
+import multiprocessing
+from functools import partial
 from pathlib import Path
 import re
 
+# lxml is optional (pip install lxml) - its libxml2 parser is considerably faster
+# on large metadata blocks, the standard library parser is used otherwise
+try:
+    from lxml import etree as ET
+    _HAVE_LXML = True
+    # Behave like the standard library parser: drop comments and processing
+    # instructions (otherwise text following a comment ends up in its tail), do not
+    # limit the document depth and never resolve external entities
+    _PARSER_OPTIONS = {
+        'remove_comments': True,
+        'remove_pis': True,
+        'huge_tree': True,
+        'resolve_entities': False,
+    }
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _HAVE_LXML = False
+    _PARSER_OPTIONS = {}
+
+_PARSE_ERR = getattr(ET, 'ParseError', None) or ET.XMLSyntaxError
+
+# Inputs at least this long are parsed incrementally with iterparse
+_ITERPARSE_MIN_SIZE = 64 * 1024
+
+# Files at least this large are memory-mapped instead of read into memory
+_MMAP_MIN_SIZE = 64 * 1024
+
+# BTF header: magic number, version, XML offset, XML length
+_HEADER = struct.Struct('<4sIII')
+
+# Magic numbers of BTF files with an XML offset/length header
+_VALID_MAGICS = frozenset({b'BTF\0', b'BTF ', b'\0FTB', b' FTB'})
+
+_TAG_RE = re.compile(r'<(/?)(\w+)[^>]*?(/?)>')
+_TAG_RE_BYTES = re.compile(rb'<(/?)(\w+)[^>]*?(/?)>')
+
+# Sentinel for missing dictionary entries
+_MISSING = object()
+
+# Indentation strings by nesting level, extended on demand by _indent
+_INDENTS = ['']
+
 def extract_xml_metadata(file_path):
     """
     Extract XML metadata from a BTF file.
@@ -14,133 +59,335 @@ def extract_xml_metadata(file_path):
     
     Returns:
     dict: Extracted metadata as a dictionary
-    str: Raw XML metadata string
+    bytes: Raw XML metadata, undecoded
     """
     try:
         with open(file_path, 'rb') as f:
-            # Read the entire file content
-            file_content = f.read()
-            
-            # Method 1: Look for XML tags in the file
-            # Try to find XML data using regex pattern matching
-            xml_pattern = re.compile(b'<\\?xml.*?>.+?</[^>]+>', re.DOTALL)
-            xml_matches = xml_pattern.findall(file_content)
-            
-            if xml_matches:
-                # Return the first XML block found
-                xml_data = xml_matches[0].decode('utf-8', errors='ignore')
-                metadata_dict = parse_xml_to_dict(xml_data)
-                return metadata_dict, xml_data
-            
-            # Method 2: Look for a specific header or marker that indicates where XML metadata begins
-            # This is hypothetical and depends on your BTF format
-            xml_marker = b'<XML>'
-            xml_end_marker = b'</XML>'
-            
-            start_pos = file_content.find(xml_marker)
-            if start_pos != -1:
-                end_pos = file_content.find(xml_end_marker, start_pos)
-                if end_pos != -1:
-                    xml_data = file_content[start_pos:end_pos + len(xml_end_marker)].decode('utf-8', errors='ignore')
+            # Map large files instead of copying their whole content into memory
+            file_content = _read_file_buffer(f)
+            try:
+                # Method 3: Check for a header structure that specifies XML offset and length
+                # This assumes the BTF has a specific format where the XML metadata location is defined
+                # in the header - you'll need to adjust this based on your actual BTF format.
+                # It is tried first since it only touches the header and the XML block itself,
+                # the other methods scan the file content
+                
+                # Example: First 4 bytes = magic number, next 4 = version, next 4 = XML offset, next 4 = XML length
+                if len(file_content) >= _HEADER.size:
+                    magic, version, xml_offset, xml_length = _HEADER.unpack_from(file_content, 0)
+                    
+                    # Check if this looks like a valid BTF file with realistic offset and length
+                    if (magic in _VALID_MAGICS and 0 < xml_offset < len(file_content)
+                            and 0 < xml_length < 10000000):
+                        xml_block = file_content[xml_offset:xml_offset + xml_length]
+                        
+                        # Check if this looks like XML
+                        if xml_block.startswith((b'<?xml', b'<XML>', b'<root>')):
+                            xml_data = xml_block
+                            metadata_dict = parse_xml_to_dict(xml_data)
+                            return metadata_dict, xml_data
+                
+                # Method 1: Look for an XML declaration and the end of its root element
+                xml_span = _find_xml_block(file_content)
+                
+                if xml_span:
+                    # Return the first XML block found
+                    xml_data = file_content[xml_span[0]:xml_span[1]]
                     metadata_dict = parse_xml_to_dict(xml_data)
                     return metadata_dict, xml_data
-            
-            # Method 3: Check for a header structure that specifies XML offset and length
-            # This assumes the BTF has a specific format where the XML metadata location is defined
-            # in the header - you'll need to adjust this based on your actual BTF format
-            
-            # Example: First 4 bytes = magic number, next 4 = version, next 4 = XML offset, next 4 = XML length
-            f.seek(0)
-            magic = f.read(4)  # Skip magic number
-            version = struct.unpack('<I', f.read(4))[0]  # Read version
-            
-            # Check if this looks like a valid BTF file with the expected structure
-            if magic == b'BTF\0' or magic == b'BTF ' or magic == b'\0FTB' or magic == b' FTB':
-                xml_offset = struct.unpack('<I', f.read(4))[0]
-                xml_length = struct.unpack('<I', f.read(4))[0]
                 
-                # Sanity check for realistic values
-                if 0 < xml_offset < os.path.getsize(file_path) and 0 < xml_length < 10000000:
-                    f.seek(xml_offset)
-                    xml_data = f.read(xml_length).decode('utf-8', errors='ignore')
-                    
-                    # Check if this looks like XML
-                    if xml_data.startswith('<?xml') or xml_data.startswith('<XML>') or xml_data.startswith('<root>'):
+                # Method 2: Look for a specific header or marker that indicates where XML metadata begins
+                # This is hypothetical and depends on your BTF format
+                xml_marker = b'<XML>'
+                xml_end_marker = b'</XML>'
+                
+                start_pos = file_content.find(xml_marker)
+                if start_pos != -1:
+                    end_pos = file_content.find(xml_end_marker, start_pos)
+                    if end_pos != -1:
+                        xml_data = file_content[start_pos:end_pos + len(xml_end_marker)]
                         metadata_dict = parse_xml_to_dict(xml_data)
                         return metadata_dict, xml_data
-            
-            # If we get here, we couldn't find XML metadata
-            print(f"No XML metadata found in {file_path}")
-            return {}, ""
+                
+                # If we get here, we couldn't find XML metadata
+                print(f"No XML metadata found in {file_path}")
+                return {}, b""
+            finally:
+                if isinstance(file_content, mmap.mmap):
+                    file_content.close()
             
     except Exception as e:
         print(f"Error extracting XML metadata: {e}")
-        return {}, ""
+        return {}, b""
+
+def _find_xml_block(buf):
+    """
+    Locate the first XML document (starting with an XML declaration) in a buffer.
+    
+    Uses plain substring searches instead of a regex so that only the bytes up to
+    the end of the root element are scanned.
+    
+    Parameters:
+    buf (bytes or mmap.mmap): Buffer to search
+    
+    Returns:
+    tuple: (start, end) offsets of the XML block, or None if no block was found
+    """
+    start = buf.find(b'<?xml')
+    if start == -1:
+        return None
+    pos = buf.find(b'>', start)
+    if pos == -1:
+        return None
+    
+    # Skip comments, doctype and processing instructions before the root element,
+    # each up to its own terminator since they may contain '>' themselves
+    while True:
+        lt = buf.find(b'<', pos)
+        if lt == -1:
+            return None
+        marker = buf[lt + 1:lt + 4]
+        if marker == b'!--':
+            pos = buf.find(b'-->', lt + 4)
+            terminator = b'-->'
+        elif marker.startswith(b'?'):
+            pos = buf.find(b'?>', lt + 2)
+            terminator = b'?>'
+        elif marker.startswith(b'!'):
+            # Doctype, possibly with an internal subset in brackets
+            pos = buf.find(b'>', lt)
+            bracket = buf.find(b'[', lt, pos)
+            if bracket != -1:
+                pos = buf.find(b']', bracket)
+                pos = buf.find(b'>', pos) if pos != -1 else -1
+            terminator = b'>'
+        else:
+            break
+        if pos == -1:
+            return None
+        pos += len(terminator)
+    
+    gt = buf.find(b'>', lt)
+    if gt == -1:
+        return None
+    root_head = buf[lt + 1:gt]
+    if root_head.endswith(b'/'):
+        # Self-closing root element
+        return start, gt + 1
+    root_tag = root_head.split(None, 1)[0] if root_head.strip() else b''
+    if not root_tag:
+        return None
+    
+    end = buf.find(b'</' + root_tag + b'>', gt)
+    if end != -1:
+        return start, end + len(root_tag) + 3
+    
+    # Root element is not closed, return up to the first closing tag and let
+    # the parser try to repair it
+    end = buf.find(b'</', gt)
+    if end == -1:
+        return None
+    end = buf.find(b'>', end)
+    if end == -1:
+        return None
+    return start, end + 1
+
+def _read_file_buffer(f):
+    """
+    Get the content of an open binary file as a searchable buffer.
+    
+    Small files are read into memory, larger files are memory-mapped so the OS
+    can page them in on demand instead of copying the whole file.
+    
+    Parameters:
+    f: File object opened in binary mode
+    
+    Returns:
+    bytes or mmap.mmap: File content (mmap objects must be closed by the caller)
+    """
+    if os.fstat(f.fileno()).st_size < _MMAP_MIN_SIZE:
+        return f.read()
+    
+    file_content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(file_content, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        file_content.madvise(mmap.MADV_SEQUENTIAL)
+    return file_content
 
 def parse_xml_to_dict(xml_string):
     """
     Parse XML string to a dictionary.
     
+    Bytes are handed to the parser as they are, so the encoding given in the XML
+    declaration is honored without decoding them first. Malformed bytes are
+    cleaned as bytes, and only if that fails too decoded as UTF-8 with invalid
+    sequences replaced.
+    
     Parameters:
-    xml_string (str): XML string to parse
+    xml_string (bytes or str): XML data to parse
     
     Returns:
     dict: Parsed XML as a nested dictionary
     """
     try:
-        # Try to parse the XML
-        root = ET.fromstring(xml_string)
-        
-        # Convert XML to dictionary
-        return xml_to_dict(root)
-    except ET.ParseError as e:
+        return _xml_string_to_dict(xml_string)
+    except _PARSE_ERR as e:
         print(f"XML parsing error: {e}")
         
         # Try to clean the XML string if it's malformed
         cleaned_xml = clean_xml_string(xml_string)
         try:
-            root = ET.fromstring(cleaned_xml)
-            return xml_to_dict(root)
+            return _xml_string_to_dict(cleaned_xml)
         except:
-            print("Failed to parse XML even after cleaning")
-            return {}
+            pass
+        
+        # Last resort for bytes: replace invalid sequences (e.g. a latin-1 unit in a
+        # block declared as UTF-8) by decoding as UTF-8, then clean again
+        if isinstance(xml_string, bytes):
+            cleaned_xml = clean_xml_string(xml_string.decode('utf-8', errors='replace'))
+            try:
+                return _xml_string_to_dict(cleaned_xml)
+            except:
+                pass
+        
+        print("Failed to parse XML even after cleaning")
+        return {}
     except Exception as e:
         print(f"Error parsing XML: {e}")
         return {}
 
+def _xml_string_to_dict(xml_string):
+    """
+    Convert an XML string to a dictionary, streaming large inputs.
+    
+    Parameters:
+    xml_string (bytes or str): XML data to convert
+    
+    Returns:
+    dict: Dictionary representation of the XML root element
+    """
+    # str input is already decoded, re-encode it and make the parser ignore the
+    # encoding named in the XML declaration
+    encoding = None
+    if isinstance(xml_string, str):
+        xml_string = xml_string.encode('utf-8')
+        encoding = 'utf-8'
+    
+    # Small blocks are cheaper to build as a full tree in one go
+    if len(xml_string) < _ITERPARSE_MIN_SIZE:
+        parser = ET.XMLParser(encoding=encoding, **_PARSER_OPTIONS)
+        return xml_to_dict(ET.fromstring(xml_string, parser))
+    return iterparse_to_dict(io.BytesIO(xml_string), encoding)
+
+def iterparse_to_dict(source, encoding=None):
+    """
+    Convert an XML stream to a dictionary without keeping the whole tree in memory.
+    
+    Produces the same structure as xml_to_dict, but builds it while parsing and
+    releases every element as soon as it has been converted.
+    
+    Parameters:
+    source: File-like object containing the XML data
+    encoding (str): Encoding overriding the one given in the XML declaration (optional)
+    
+    Returns:
+    dict: Dictionary representation of the XML root element
+    """
+    stack = []
+    result = {}
+    if _HAVE_LXML:
+        events = ET.iterparse(source, events=('start', 'end'), encoding=encoding, **_PARSER_OPTIONS)
+    else:
+        events = ET.iterparse(source, events=('start', 'end'), parser=ET.XMLParser(encoding=encoding))
+    for event, elem in events:
+        if event == 'start':
+            # Dictionary of the element, the tags that occurred multiple times in it
+            # and the element itself
+            stack.append(({f"@{key}": value for key, value in elem.attrib.items()}, set(), elem))
+            continue
+        
+        node = stack.pop()[0]
+        tag = elem.tag
+        
+        # Handle text content
+        if elem.text and elem.text.strip():
+            if node:
+                node["#text"] = elem.text.strip()
+            else:
+                node = elem.text.strip()
+        
+        # Release the converted element
+        elem.clear()
+        if not stack:
+            result = node
+            break
+        
+        # Detach it from its parent as well, all its preceding siblings have already
+        # been detached, so it is the first child
+        parent_dict, multi, parent_elem = stack[-1]
+        parent_elem.remove(elem)
+        _add_child(parent_dict, multi, tag, node)
+    
+    return result
+
 def clean_xml_string(xml_string):
     """
     Attempt to clean a potentially malformed XML string.
     
     Parameters:
-    xml_string (str): XML string to clean
+    xml_string (bytes or str): XML data to clean
     
     Returns:
-    str: Cleaned XML string
+    bytes or str: Cleaned XML data, of the same type as the input
     """
-    # Replace common problematic characters
-    cleaned = xml_string.replace('\x00', '')
-    
-    # Ensure proper XML declaration
-    if not cleaned.startswith('<?xml'):
-        cleaned = '<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
+    if isinstance(xml_string, bytes):
+        # Replace common problematic characters
+        cleaned = xml_string.replace(b'\x00', b'')
+        
+        # Ensure proper XML declaration
+        if not cleaned.startswith(b'<?xml'):
+            cleaned = b'<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
+        tag_re = _TAG_RE_BYTES
+    else:
+        cleaned = xml_string.replace('\x00', '')
+        if not cleaned.startswith('<?xml'):
+            cleaned = '<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
+        tag_re = _TAG_RE
     
-    # Try to fix unclosed tags (very basic approach)
+    # Try to fix unclosed tags (very basic approach): track the open elements
+    # in a single pass over all tags
     open_tags = []
-    for match in re.finditer(r'<(\w+)[^>]*>', cleaned):
-        tag = match.group(1)
-        open_tags.append(tag)
+    # Number of open elements per tag, so unmatched closing tags are skipped in O(1)
+    open_counts = {}
+    for match in tag_re.finditer(cleaned):
+        closing, tag, self_closing = match.groups()
+        if self_closing:
+            continue
+        if not closing:
+            open_tags.append(tag)
+            open_counts[tag] = open_counts.get(tag, 0) + 1
+        elif open_counts.get(tag):
+            # Close the innermost open element with this tag, together with any
+            # elements opened inside it that were never closed
+            while True:
+                top = open_tags.pop()
+                open_counts[top] -= 1
+                if top == tag:
+                    break
     
     # Add closing tags for any unclosed tags
-    for tag in reversed(open_tags):
-        if f'</{tag}>' not in cleaned:
-            cleaned += f'</{tag}>'
+    if isinstance(cleaned, bytes):
+        cleaned += b''.join(b'</' + tag + b'>' for tag in reversed(open_tags))
+    else:
+        cleaned += ''.join(f'</{tag}>' for tag in reversed(open_tags))
     
     return cleaned
 
 def xml_to_dict(element):
     """
-    Convert an XML element to a dictionary recursively.
+    Convert an XML element to a dictionary.
+    
+    The tree is walked with an explicit stack, so arbitrarily deep documents do
+    not run into the recursion limit.
     
     Parameters:
     element: XML element to convert
@@ -150,55 +397,91 @@ def xml_to_dict(element):
     """
     result = {}
     
-    # Process attributes
-    for key, value in element.attrib.items():
-        result[f"@{key}"] = value
-    
-    # Process children
-    for child in element:
-        child_dict = xml_to_dict(child)
+    # Entries are (element, parent, own dict), where parent is the dict of the parent
+    # element with its set of repeated tags and the own dict is None until the
+    # children of the element have been scheduled
+    stack = [(element, None, None)]
+    while stack:
+        elem, parent, node = stack.pop()
+        tag = elem.tag
+        text = elem.text
         
-        # Handle case where a tag appears multiple times
-        if child.tag in result:
-            if type(result[child.tag]) is list:
-                result[child.tag].append(child_dict)
+        if node is None:
+            attrib = elem.attrib
+            if attrib or len(elem):
+                # Process attributes, then revisit the element after its children
+                node = {f"@{key}": value for key, value in attrib.items()}
+                stack.append((elem, parent, node))
+                
+                # Process children (lxml: skip comments and processing instructions in
+                # trees that were not parsed by parse_xml_to_dict)
+                child_parent = (node, set())
+                if _HAVE_LXML:
+                    children = elem.iterchildren(tag=ET.Element, reversed=True)
+                else:
+                    children = reversed(elem)
+                for child in children:
+                    stack.append((child, child_parent, None))
+                continue
+            
+            # Leaf element without attributes, its value is just the text (if any)
+            node = text.strip() if text and text.strip() else {}
+        elif text and text.strip():
+            # If we have both text and children/attributes, use #text for the text content
+            if node:
+                node["#text"] = text.strip()
             else:
-                result[child.tag] = [result[child.tag], child_dict]
-        else:
-            result[child.tag] = child_dict
-    
-    # Handle text content
-    if element.text and element.text.strip():
-        # If we have both text and children/attributes, use #text for the text content
-        if result:
-            result["#text"] = element.text.strip()
+                node = text.strip()
+        
+        if parent is None:
+            result = node
         else:
-            # If we only have text content, just return it directly
-            return element.text.strip()
+            _add_child(parent[0], parent[1], tag, node)
     
     return result
 
+def _add_child(parent_dict, multi, tag, node):
+    """
+    Add a converted child element to the dictionary of its parent.
+    
+    Parameters:
+    parent_dict (dict): Dictionary of the parent element
+    multi (set): Tags that already occurred multiple times in the parent element
+    tag (str): Tag of the child element
+    node: Converted child element
+    """
+    # Handle case where a tag appears multiple times: the first occurrence is
+    # stored directly, the second one turns the entry into a list
+    existing = parent_dict.get(tag, _MISSING)
+    if existing is _MISSING:
+        parent_dict[tag] = node
+    elif tag in multi:
+        existing.append(node)
+    else:
+        parent_dict[tag] = [existing, node]
+        multi.add(tag)
+
 def save_metadata_to_file(metadata_dict, xml_data, output_path):
     """
     Save extracted metadata to files.
     
     Parameters:
     metadata_dict (dict): Dictionary of metadata
-    xml_data (str): Raw XML string
+    xml_data (bytes or str): Raw XML data
     output_path (str): Base path for output files
     """
-    # Save raw XML
+    # Save raw XML, bytes are dumped as extracted from the BTF file
+    if isinstance(xml_data, str):
+        xml_data = xml_data.encode('utf-8')
     xml_path = f"{output_path}.xml"
-    with open(xml_path, 'w', encoding='utf-8') as f:
+    with open(xml_path, 'wb') as f:
         f.write(xml_data)
     print(f"Raw XML metadata saved to {xml_path}")
     
     # Save structured metadata as text
     txt_path = f"{output_path}.txt"
     with open(txt_path, 'w', encoding='utf-8') as f:
-        f.write("BTF Metadata Summary\n")
-        f.write("===================\n\n")
-        write_dict_to_file(f, metadata_dict)
+        f.write("BTF Metadata Summary\n===================\n\n" + _format_dict(metadata_dict))
     print(f"Formatted metadata saved to {txt_path}")
 
 def write_dict_to_file(file, d, indent=0):
@@ -210,25 +493,119 @@ def write_dict_to_file(file, d, indent=0):
     d (dict): Dictionary to write
     indent (int): Current indentation level
     """
-    for key, value in d.items():
+    file.write(_format_dict(d, indent))
+
+def _format_dict(d, indent=0):
+    """
+    Format a dictionary as indented text.
+    
+    The text is collected in a list and joined once, nested dictionaries and
+    lists are walked with an explicit stack.
+    
+    Parameters:
+    d (dict): Dictionary to format
+    indent (int): Indentation level of the top-level keys
+    
+    Returns:
+    str: Formatted dictionary
+    """
+    parts = []
+    # Entries are (iterator, indentation level, whether the iterator runs over list items)
+    stack = [(iter(d.items()), indent, False)]
+    while stack:
+        items, indent, is_list = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            continue
+        
+        if is_list:
+            i, value = item
+            parts.append(_indent(indent) + f"Item {i+1}:\n")
+            if isinstance(value, dict):
+                stack.append((iter(value.items()), indent + 1, False))
+            else:
+                parts.append(_indent(indent + 1) + f"{value}\n")
+            continue
+        
+        key, value = item
         if isinstance(value, dict):
-            file.write('  ' * indent + f"{key}:\n")
-            write_dict_to_file(file, value, indent + 1)
+            parts.append(_indent(indent) + f"{key}:\n")
+            stack.append((iter(value.items()), indent + 1, False))
         elif isinstance(value, list):
-            file.write('  ' * indent + f"{key}: [list with {len(value)} items]\n")
-            for i, item in enumerate(value):
-                file.write('  ' * (indent + 1) + f"Item {i+1}:\n")
-                if isinstance(item, dict):
-                    write_dict_to_file(file, item, indent + 2)
-                else:
-                    file.write('  ' * (indent + 2) + f"{item}\n")
+            parts.append(_indent(indent) + f"{key}: [list with {len(value)} items]\n")
+            stack.append((enumerate(value), indent + 1, True))
         else:
-            file.write('  ' * indent + f"{key}: {value}\n")
+            parts.append(_indent(indent) + f"{key}: {value}\n")
+    
+    return ''.join(parts)
+
+def _indent(level):
+    """
+    Get the indentation string for a nesting level.
+    
+    Parameters:
+    level (int): Indentation level
+    
+    Returns:
+    str: Indentation string
+    """
+    while len(_INDENTS) <= level:
+        _INDENTS.append('  ' * len(_INDENTS))
+    return _INDENTS[level]
+
+def _process_one(file_path, output_dir):
+    """
+    Extract the XML metadata of a single BTF file and save it to the output directory.
+    
+    Parameters:
+    file_path (str): Path to the BTF file
+    output_dir (str): Directory to save the output files to
+    """
+    metadata_dict, xml_data = extract_xml_metadata(file_path)
+    if xml_data:
+        output_base = Path(output_dir) / Path(file_path).stem
+        save_metadata_to_file(metadata_dict, xml_data, str(output_base))
+
+def _iter_btf(directory):
+    """
+    Lazily yield the paths of all BTF files in a directory.
+    
+    Parameters:
+    directory (str): Directory to search
+    
+    Yields:
+    str: Path to a BTF file
+    """
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith('.btf') and entry.is_file():
+                yield entry.path
+
+def _positive_int(value):
+    """
+    Parse a command line argument as an integer of at least 1.
+    
+    Parameters:
+    value (str): Argument value
+    
+    Returns:
+    int: Parsed value
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 def main():
     parser = argparse.ArgumentParser(description='Extract XML metadata from BTF files')
     parser.add_argument('input', help='Input BTF file or directory containing BTF files')
     parser.add_argument('-o', '--output', help='Output directory (optional)')
+    parser.add_argument('-j', '--jobs', type=_positive_int, default=None,
+                        help='Number of worker processes for directories (default: number of CPUs)')
     args = parser.parse_args()
     
     input_path = Path(args.input)
@@ -239,23 +616,25 @@ def main():
     
     if input_path.is_file():
         # Process single file
-        metadata_dict, xml_data = extract_xml_metadata(str(input_path))
-        if xml_data:
-            output_base = output_dir / input_path.stem
-            save_metadata_to_file(metadata_dict, xml_data, str(output_base))
+        _process_one(str(input_path), str(output_dir))
     elif input_path.is_dir():
-        # Process all BTF files in directory
-        btf_files = list(input_path.glob('*.btf'))
-        if not btf_files:
+        # Process all BTF files in directory, handing them out while the directory is still being listed
+        process = partial(_process_one, output_dir=str(output_dir))
+        num_files = 0
+        if args.jobs == 1:
+            for btf_file in _iter_btf(input_path):
+                process(btf_file)
+                num_files += 1
+        else:
+            # Files are independent, so spread them over worker processes
+            with multiprocessing.Pool(args.jobs) as pool:
+                for _ in pool.imap_unordered(process, _iter_btf(input_path), chunksize=8):
+                    num_files += 1
+        
+        if num_files:
+            print(f"Processed {num_files} BTF files")
+        else:
             print(f"No BTF files found in {input_path}")
-            return
-            
-        print(f"Found {len(btf_files)} BTF files to process")
-        for btf_file in btf_files:
-            metadata_dict, xml_data = extract_xml_metadata(str(btf_file))
-            if xml_data:
-                output_base = output_dir / btf_file.stem
-                save_metadata_to_file(metadata_dict, xml_data, str(output_base))
     else:
         print(f"Input path does not exist: {input_path}")
 
@@ -0,0 +1,223 @@
+import importlib
+import io
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(params=["lxml", "stdlib"])
+def extractor(request, monkeypatch):
+    """btf_xml_metadata_extractor imported with lxml and with the standard library parser"""
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    else:
+        monkeypatch.setitem(sys.modules, "lxml", None)
+    monkeypatch.syspath_prepend(str(REPO_ROOT))
+    sys.modules.pop("btf_xml_metadata_extractor", None)
+    module = importlib.import_module("btf_xml_metadata_extractor")
+    assert module._HAVE_LXML == (request.param == "lxml")
+    yield module
+    sys.modules.pop("btf_xml_metadata_extractor", None)
+
+
+def test_iterparse_leading_comment(extractor):
+    items = b"".join(
+        b'<Item id="%d"><Name>n%d</Name></Item>' % (i, i) for i in range(5000)
+    )
+    xml_data = (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b"<!-- hdr -->\n"
+        b'<?xml-stylesheet href="style.xsl"?>\n'
+        b"<root>" + items + b"</root>"
+    )
+    assert len(xml_data) >= extractor._ITERPARSE_MIN_SIZE
+
+    result = extractor.parse_xml_to_dict(xml_data)
+
+    assert len(result["Item"]) == 5000
+    assert result["Item"][-1] == {"@id": "4999", "Name": "n4999"}
+
+
+@pytest.mark.parametrize(
+    "xml_string, expected",
+    [
+        ("<a><b>x</b><c/><d>", "<a><b>x</b><c/><d></d></a>"),
+        ("<a><b><b>1</b>", "<a><b><b>1</b></b></a>"),
+        (b"<a><p>x<b>y</b>", b"<a><p>x<b>y</b></p></a>"),
+    ],
+)
+def test_clean_xml_string_closes_unclosed_tags(extractor, xml_string, expected):
+    cleaned = extractor.clean_xml_string(xml_string)
+
+    assert cleaned.endswith(expected)
+
+
+def test_parse_xml_to_dict_invalid_utf8(extractor):
+    xml_data = (
+        b'<?xml version="1.0" encoding="UTF-8"?><root><unit>\xb5m</unit><x>1</x></root>'
+    )
+
+    result = extractor.parse_xml_to_dict(xml_data)
+
+    assert result == {"unit": "\ufffdm", "x": "1"}
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2", "x"])
+def test_main_rejects_invalid_jobs(extractor, monkeypatch, tmp_path, jobs):
+    monkeypatch.setattr(
+        sys, "argv", ["btf_xml_metadata_extractor.py", str(tmp_path), "--jobs", jobs]
+    )
+
+    with pytest.raises(SystemExit) as excinfo:
+        extractor.main()
+
+    assert excinfo.value.code == 2
+
+
+@pytest.mark.parametrize("repeat", [1, 20000])
+def test_parse_xml_to_dict_str_ignores_declared_encoding(extractor, repeat):
+    xml_string = (
+        '<?xml version="1.0" encoding="ISO-8859-1"?><r>' + "<a>é</a>" * repeat + "</r>"
+    )
+
+    result = extractor.parse_xml_to_dict(xml_string)
+
+    assert result == {"a": "é" if repeat == 1 else ["é"] * repeat}
+
+
+# filler pushes the document above _ITERPARSE_MIN_SIZE
+@pytest.mark.parametrize("filler", [0, 20000])
+def test_parse_xml_to_dict_deep_document(extractor, filler):
+    depth = 300
+    xml_data = b"<a>" * depth + b"x" + b"<f/>" * filler + b"</a>" * depth
+
+    result = extractor.parse_xml_to_dict(xml_data)
+
+    # The root element is the result itself, descend into the innermost element
+    for _ in range(depth - 1):
+        result = result["a"]
+    if filler:
+        assert result["#text"] == "x"
+    else:
+        assert result == "x"
+
+
+def test_parse_xml_to_dict_malformed_declared_encoding(extractor):
+    xml_data = b'<?xml version="1.0" encoding="ISO-8859-1"?><r><u>\xb5m</u><v>1</v>'
+
+    result = extractor.parse_xml_to_dict(xml_data)
+
+    assert result == {"u": "µm", "v": "1"}
+
+
+@pytest.mark.parametrize(
+    "buf, expected",
+    [
+        # Embedded in binary data
+        (
+            b'\x00\xff<?xml version="1.0"?><r a="1"><b>x</b></r>\x00<c></c>',
+            b'<?xml version="1.0"?><r a="1"><b>x</b></r>',
+        ),
+        # Comment, doctype with internal subset and processing instruction before the root
+        (
+            b'<?xml version="1.0"?><!-- a -> <b> --><!DOCTYPE r [<!ENTITY e "v">]><?pi x > y?><r><b>x</b><c/></r>\x00',
+            b'<?xml version="1.0"?><!-- a -> <b> --><!DOCTYPE r [<!ENTITY e "v">]><?pi x > y?><r><b>x</b><c/></r>',
+        ),
+        # Self-closing root
+        (
+            b'\x00<?xml version="1.0"?>\n<r a="1"/>\x00</x>',
+            b'<?xml version="1.0"?>\n<r a="1"/>',
+        ),
+        # Missing root close falls back to the first closing tag
+        (
+            b'<?xml version="1.0"?><r><b>x</b><c>y</c>\x00',
+            b'<?xml version="1.0"?><r><b>x</b>',
+        ),
+        # No XML declaration or no root element
+        (b"\x00<r></r>", None),
+        (b'<?xml version="1.0"?><!-- unterminated', None),
+    ],
+)
+def test_find_xml_block(extractor, buf, expected):
+    span = extractor._find_xml_block(buf)
+
+    if expected is None:
+        assert span is None
+    else:
+        assert buf[span[0] : span[1]] == expected
+
+
+def _header_btf(xml_data, xml_offset, size, prefix=b""):
+    """BTF file content with an XML offset/length header and the XML block at xml_offset"""
+    content = struct.pack("<4sIII", b"BTF\0", 1, xml_offset, len(xml_data)) + prefix
+    content += b"\0" * (xml_offset - len(content)) + xml_data
+    return content + b"\0" * (size - len(content))
+
+
+HEADER_XML = b'<root><B k="v">t</B></root>'
+EMBEDDED_XML = b'<?xml version="1.0" encoding="UTF-8"?>\n<root a="1"><C id="0">x</C><C id="1">y</C></root>'
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        # Header-based file, small enough to be read into memory
+        (
+            _header_btf(HEADER_XML, 64, 256),
+            ({"B": {"@k": "v", "#text": "t"}}, HEADER_XML),
+        ),
+        # Header-based file, memory-mapped; the header wins over a scanned XML block
+        (
+            _header_btf(HEADER_XML, 70000, 140000, prefix=EMBEDDED_XML),
+            ({"B": {"@k": "v", "#text": "t"}}, HEADER_XML),
+        ),
+        # XML declaration embedded in binary data, memory-mapped
+        (
+            b"\x01" * 70000 + EMBEDDED_XML + b"\x02" * 70000,
+            (
+                {
+                    "@a": "1",
+                    "C": [{"@id": "0", "#text": "x"}, {"@id": "1", "#text": "y"}],
+                },
+                EMBEDDED_XML,
+            ),
+        ),
+        # <XML> marker
+        (
+            b"\0" * 50 + b"<XML><A>1</A><A>2</A></XML>" + b"\0" * 50,
+            ({"A": ["1", "2"]}, b"<XML><A>1</A><A>2</A></XML>"),
+        ),
+        # Empty file and file shorter than the header
+        (b"", ({}, b"")),
+        (b"BTF\0ab", ({}, b"")),
+    ],
+)
+def test_extract_xml_metadata(extractor, tmp_path, content, expected):
+    btf_path = tmp_path / "image.btf"
+    btf_path.write_bytes(content)
+
+    assert extractor.extract_xml_metadata(str(btf_path)) == expected
+
+
+def test_iterparse_to_dict_matches_xml_to_dict(extractor):
+    items = b"".join(
+        b'<Item id="%d">text<Name>n%d</Name><!-- c --><Value>%d</Value></Item><Other/>'
+        % (i, i, i)
+        for i in range(2000)
+    )
+    xml_data = (
+        b'<?xml version="1.0" encoding="UTF-8"?><root a="1">head' + items + b"</root>"
+    )
+    assert len(xml_data) >= extractor._ITERPARSE_MIN_SIZE
+
+    expected = extractor.xml_to_dict(
+        extractor.ET.fromstring(
+            xml_data, extractor.ET.XMLParser(**extractor._PARSER_OPTIONS)
+        )
+    )
+
+    assert extractor.iterparse_to_dict(io.BytesIO(xml_data)) == expected